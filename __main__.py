@@ -34,6 +34,8 @@ try:
     from .parser import parse_report_text as Parser, get_unrecognized_lines, analyze_detection_success, CONFIG_FILENAME, config_path as PARSER_CONFIG_PATH # Importar ruta config
     from .formatter import format_summary as Formatter
     from .gui import launch_gui_tkinter as GuiLauncher
+    from .profiler import BatchProfiler, DEFAULT_TOP_N
+    from .layout_templates import LayoutTemplateStore
 except ImportError as e:
     logger.warning(f"Import relativo falló ({e}), intentando directo...")
     try:
@@ -41,21 +43,35 @@ except ImportError as e:
         from parser import parse_report_text as Parser, get_unrecognized_lines, analyze_detection_success, CONFIG_FILENAME, config_path as PARSER_CONFIG_PATH
         from formatter import format_summary as Formatter
         from gui import launch_gui_tkinter as GuiLauncher
+        from profiler import BatchProfiler, DEFAULT_TOP_N
+        from layout_templates import LayoutTemplateStore
         logger.info("Usando importaciones directas.")
     except ImportError as direct_e:
         logger.critical(f"Error import módulos: {direct_e}.", exc_info=True); print(f"Error fatal: {direct_e}", file=sys.stderr); sys.exit(1)
 
 # --- Funciones CLI y Main ---
-def run_cli(pdf_path: Path):
+def positive_int(value: str) -> int:
+    try: number = int(value)
+    except ValueError: raise argparse.ArgumentTypeError(f"'{value}' no es un entero.")
+    if number < 1: raise argparse.ArgumentTypeError(f"debe ser >= 1 (recibido {number}).")
+    return number
+
+def run_cli(pdf_path: Path, profiler: BatchProfiler | None = None, template_store: LayoutTemplateStore | None = None):
     logger.info(f"CLI para: {pdf_path}")
     if not PARSER_CONFIG_PATH: print(f"Error: No se encontró {CONFIG_FILENAME}", file=sys.stderr); return 1
+    profiler = profiler or BatchProfiler(DATA_DIR)
     try:
-        extractor = Extractor(pdf_path); raw_text = extractor.extract_text()
-        if not raw_text or not raw_text.strip(): print("\nError: No texto.", file=sys.stderr); return 1
-        parsed_data = Parser(raw_text); summary = Formatter(parsed_data)
+        with profiler.profile_file(pdf_path):
+            extractor = Extractor(pdf_path); raw_text = profiler.call(extractor.extract_text)
+            if not raw_text or not raw_text.strip(): print("\nError: No texto.", file=sys.stderr); return 1
+            parsed_data = profiler.call(Parser, raw_text, template_store=template_store); summary = profiler.call(Formatter, parsed_data)
         print("\n--- Resumen Analítica (v1.2.3) ---"); print(summary); print("-" * 30)
         logger.info("CLI completada."); return 0
     except Exception as e: print(f"\nError CLI: {e}", file=sys.stderr); logger.error("Error CLI", exc_info=True); return 1
+    finally:
+        if template_store is not None: template_store.save(); logger.info(template_store.summary())
+        report_path = profiler.write_report()
+        if report_path: print(f"Resumen de perfilado: {report_path}")
 
 def main() -> int:
     cli_description = f"""Transcribe informes analíticos PDF. v1.2.3
@@ -66,6 +82,10 @@ GUI permite lotes. NO LEE PDFs ESCANEADOS.
     parser.add_argument("pdf_path", nargs="?", type=Path, help="Ruta PDF (solo modo CLI).")
     parser.add_argument("--gui", action="store_true", help="Forzar modo GUI.")
     parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], help='Nivel logs.')
+    parser.add_argument("--profile", action="store_true", help="Perfilar CPU (cProfile) por archivo; guarda .pstats en el directorio de datos.")
+    parser.add_argument("--trace-memory", action="store_true", help="Perfilar memoria (tracemalloc) por archivo; guarda snapshots en el directorio de datos.")
+    parser.add_argument("--profile-top", type=positive_int, default=DEFAULT_TOP_N, help=f"Nº de entradas del resumen de perfilado (por defecto {DEFAULT_TOP_N}).")
+    parser.add_argument("--no-templates", action="store_true", help="No usar ni aprender plantillas de formato por laboratorio (siempre parseo completo).")
     args = parser.parse_args()
 
     log_level_numeric = getattr(logging, args.log_level.upper(), logging.INFO)
@@ -89,12 +109,13 @@ GUI permite lotes. NO LEE PDFs ESCANEADOS.
         try:
             try: import pyperclip; import tkinter; from tkinter import ttk
             except ImportError as gui_dep_err: logger.critical(f"Falta dep GUI: {gui_dep_err}.", exc_info=True); print(f"Error: {gui_dep_err}", file=sys.stderr); return 1
-            GuiLauncher()
+            GuiLauncher(profile_cpu=args.profile, trace_memory=args.trace_memory, profile_top=args.profile_top, use_templates=not args.no_templates, data_dir=DATA_DIR)
         except Exception as e: logger.critical("Error GUI", exc_info=True); print(f"Error GUI: {e}", file=sys.stderr); return 1
     else:
         pdf_file = Path(args.pdf_path)
         if not pdf_file.is_file(): print(f"Error: PDF no encontrado: {pdf_file}", file=sys.stderr); logger.error(f"PDF no válido CLI: {pdf_file}"); return 1
-        return run_cli(pdf_file)
+        template_store = None if args.no_templates else LayoutTemplateStore(DATA_DIR)
+        return run_cli(pdf_file, BatchProfiler(DATA_DIR, cpu=args.profile, memory=args.trace_memory, top_n=args.profile_top), template_store)
     return 0
 
 if __name__ == "__main__":
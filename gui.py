@@ -13,11 +13,15 @@ try:
     # FIX: Importar fuzzy_match_parameter 
     from .parser import parse_report_text, get_unrecognized_lines, analyze_detection_success, fuzzy_match_parameter, CONFIG_FILENAME
     from .formatter import format_summary
+    from .profiler import BatchProfiler, DEFAULT_TOP_N
+    from .layout_templates import LayoutTemplateStore
 except ImportError:
     from extractor import PDFExtractor
     # FIX: Importar fuzzy_match_parameter
     from parser import parse_report_text, get_unrecognized_lines, analyze_detection_success, fuzzy_match_parameter, CONFIG_FILENAME
     from formatter import format_summary
+    from profiler import BatchProfiler, DEFAULT_TOP_N
+    from layout_templates import LayoutTemplateStore
 
 logger = logging.getLogger(__name__)
 DATA_DIR = Path(os.path.expanduser("~")) / "lab_transcriber_data"
@@ -34,8 +38,11 @@ INSTRUCTIONS = """**Lab Transcriber v1.2.2 - Guía Rápida**
 IMPORTANTE: Solo procesa PDFs con texto seleccionable, NO funciona con PDFs escaneados."""
 
 class LabTranscriberApp:
-    def __init__(self, root):
+    def __init__(self, root, profile_cpu=False, trace_memory=False, profile_top=DEFAULT_TOP_N, use_templates=True, data_dir=DATA_DIR):
         self.root = root
+        self.data_dir = Path(data_dir) # El de __main__ al lanzar desde la CLI; DATA_DIR propio solo con launcher.py
+        self.profile_options = {"cpu": profile_cpu, "memory": trace_memory, "top_n": profile_top}
+        self.template_store = LayoutTemplateStore(self.data_dir) if use_templates else None
         self.root.title(f"Lab Transcriber v1.2.2 (Config: {CONFIG_FILENAME})") # Título actualizado
         self.root.geometry("850x680") # Aumentar un poco la altura para la firma
         self.status_text = tk.StringVar()
@@ -104,6 +111,8 @@ class LabTranscriberApp:
         self.results_area.delete('1.0', tk.END); self.copy_button.configure(state=tk.DISABLED)
         self.root.update_idletasks()
         success_count = 0; error_count = 0; results_available = False
+        profiler = BatchProfiler(self.data_dir, **self.profile_options)
+        if self.template_store is not None: self.template_store.reset_session_stats()
 
         for i, filepath in enumerate(filepaths):
             filename = os.path.basename(filepath)
@@ -112,11 +121,12 @@ class LabTranscriberApp:
             self.results_area.insert(tk.END, separator); self.root.update_idletasks()
             try:
                 logger.info(f"[{i+1}/{total_files}] Procesando: {filepath}")
-                extractor = PDFExtractor(filepath); raw_text = extractor.extract_text()
-                if not raw_text or not raw_text.strip(): raise ValueError("No se extrajo texto.")
-                logger.info(f"[{i+1}/{total_files}] Parseando..."); parsed_data = parse_report_text(raw_text)
-                self.last_raw_text = raw_text; self.last_parsed_data = parsed_data; self.last_filepath = filepath
-                logger.info(f"[{i+1}/{total_files}] Formateando..."); summary = format_summary(parsed_data)
+                with profiler.profile_file(filepath):
+                    extractor = PDFExtractor(filepath); raw_text = profiler.call(extractor.extract_text)
+                    if not raw_text or not raw_text.strip(): raise ValueError("No se extrajo texto.")
+                    logger.info(f"[{i+1}/{total_files}] Parseando..."); parsed_data = profiler.call(parse_report_text, raw_text, template_store=self.template_store)
+                    self.last_raw_text = raw_text; self.last_parsed_data = parsed_data; self.last_filepath = filepath
+                    logger.info(f"[{i+1}/{total_files}] Formateando..."); summary = profiler.call(format_summary, parsed_data)
                 self.results_area.insert(tk.END, summary); success_count += 1; results_available = True
             except Exception as e:
                 error_msg = f"Error {filename}: {type(e).__name__}: {e}"
@@ -127,6 +137,10 @@ class LabTranscriberApp:
 
         final_status = f"Completado. {success_count}/{total_files} OK."; final_bg_color = 'white'
         if error_count > 0: final_status += f" {error_count} con errores."; final_bg_color = 'pink'
+        if self.template_store is not None:
+            self.template_store.save(); final_status += f" {self.template_store.summary()}."
+        report_path = profiler.write_report()
+        if report_path: final_status += f" Perfil: {report_path}"
         self.status_text.set(final_status); self.results_area.configure(state=tk.DISABLED, bg=final_bg_color)
         if results_available: self.copy_button.configure(state=tk.NORMAL)
         if error_count > 0: messagebox.showwarning("Errores", f"{final_status}\nRevisa resultados.", parent=self.root)
@@ -139,7 +153,7 @@ class LabTranscriberApp:
             except Exception as clip_err: logger.error(f"Error copia: {clip_err}", exc_info=True); self.status_text.set("Error copia."); messagebox.showwarning("Error Copia", "No se pudo copiar.\nSelecciona manualmente.", parent=self.root)
         else: self.status_text.set("Nada que copiar.")
 
-def launch_gui_tkinter():
+def launch_gui_tkinter(profile_cpu=False, trace_memory=False, profile_top=DEFAULT_TOP_N, use_templates=True, data_dir=DATA_DIR):
     root = tk.Tk()
-    app = LabTranscriberApp(root)
+    app = LabTranscriberApp(root, profile_cpu=profile_cpu, trace_memory=trace_memory, profile_top=profile_top, use_templates=use_templates, data_dir=data_dir)
     root.mainloop()
\ No newline at end of file
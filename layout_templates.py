@@ -0,0 +1,284 @@
+# lab_transcriber/layout_templates.py (v1.4.0 - Plantillas de formato aprendidas por laboratorio)
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from . import parser as parser_module
+except ImportError:
+    import parser as parser_module
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_FILENAME = "layout_templates.json"
+TEMPLATES_FILE_VERSION = 2
+HEADER_LINES = 3            # Primeras líneas con alias cuyo alias forma la firma de cabecera
+MIN_TEMPLATE_ENTRIES = 3    # No aprender plantillas de informes con menos parámetros
+MAX_TEMPLATES = 50
+MAX_CANDIDATES = 3          # Plantillas verificadas como máximo por informe
+FUZZY_THRESHOLD = 0.70      # Mismo umbral que la Pasada 2 de parse_report_text
+
+def _empty_stats() -> dict:
+    return {"parsed": 0, "hits": 0, "fallbacks": 0, "learned": 0, "saved_seconds": 0.0}
+
+class LayoutTemplateStore:
+    """Plantillas de formato aprendidas (una por sistema de laboratorio) guardadas en DATA_DIR.
+
+    Una plantilla es la firma de cabecera (alias de las primeras líneas de parámetros) más la secuencia
+    de líneas de alias reconocidas por el parser completo, con el parámetro y el desplazamiento de línea
+    de su valor. Los informes que encajan se parsean por consulta directa; cualquier línea no prevista
+    que el parser completo pudiera reconocer invalida la plantilla y se vuelve a parse_report_layout.
+    Del texto de los informes solo se guardan hashes con sal, nunca líneas legibles (datos de pacientes).
+    """
+    def __init__(self, data_dir: str | Path):
+        self.path = Path(data_dir) / TEMPLATES_FILENAME
+        self.templates: list[dict] = []
+        self.salt = os.urandom(16).hex()
+        self.total_stats = _empty_stats()   # Acumulado persistido entre ejecuciones
+        self.session_stats = _empty_stats() # Solo esta ejecución / lote
+        self._dirty = False
+        self._config_signature_cache: tuple[dict, str] | None = None
+        self.load()
+
+    # --- Persistencia ---
+    def load(self):
+        if not self.path.is_file(): return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f: data = json.load(f)
+            if data.get("version") != TEMPLATES_FILE_VERSION: raise ValueError(f"Versión de plantillas no soportada: {data.get('version')}")
+            self.salt = data["salt"]
+            self.templates = data.get("templates", [])
+            for template in self.templates:
+                template["known_lines"] = set(template["known_lines"]); template["silent_alias_lines"] = set(template["silent_alias_lines"])
+            self.total_stats.update(data.get("stats", {}))
+            logger.info(f"{len(self.templates)} plantillas de formato cargadas desde: {self.path}")
+        except Exception as e:
+            logger.warning(f"No se pudieron cargar las plantillas '{self.path}' ({e}). Se empieza sin plantillas.")
+            self.templates = []; self.salt = os.urandom(16).hex()
+
+    def save(self):
+        if not self._dirty: return
+        try:
+            os.makedirs(self.path.parent, exist_ok=True)
+            templates = [{**t, "known_lines": sorted(t["known_lines"]), "silent_alias_lines": sorted(t["silent_alias_lines"])} for t in self.templates]
+            data = {"version": TEMPLATES_FILE_VERSION, "salt": self.salt, "stats": self.total_stats, "templates": templates}
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Error guardando plantillas en '{self.path}': {e}", exc_info=True)
+
+    # --- Parseo ---
+    def parse(self, raw_text: str) -> dict:
+        """Parsea con la primera plantilla que encaje; si ninguna encaja, parseo completo y aprendizaje."""
+        lines = raw_text.splitlines()
+        header = self._header_signature(lines)
+        config_signature = self._config_signature()
+        self._record("parsed")
+        candidates = self._candidates(header, config_signature)
+        verify_start = time.perf_counter()
+        for template in candidates:
+            fast_start = time.perf_counter()
+            results = self._apply(template, lines)
+            if results is None:
+                logger.debug(f"Plantilla {template['id']} no encaja.")
+                continue
+            fast_seconds = time.perf_counter() - fast_start
+            saved = max(template["full_parse_seconds"] - fast_seconds, 0.0)
+            template["hits"] += 1; template["last_used"] = datetime.now().isoformat(timespec="seconds")
+            self._record("hits"); self._record("saved_seconds", saved)
+            logger.info(f"Plantilla {template['id']} aplicada ({fast_seconds*1000:.1f} ms, ~{saved*1000:.1f} ms ahorrados).")
+            return results
+        if candidates:
+            # La verificación fallida es tiempo perdido frente al parseo completo directo
+            self._record("fallbacks"); self._record("saved_seconds", -(time.perf_counter() - verify_start))
+            logger.info(f"Ninguna de las {len(candidates)} plantillas encaja con el informe. Parseo completo.")
+
+        full_start = time.perf_counter()
+        results, layout_entries = parser_module.parse_report_layout(raw_text)
+        full_seconds = time.perf_counter() - full_start
+        self._learn(lines, header, config_signature, results, layout_entries, full_seconds)
+        return results
+
+    def reset_session_stats(self):
+        """Reinicia las estadísticas de summary() (p. ej. al empezar un nuevo lote en la GUI)."""
+        self.session_stats = _empty_stats()
+
+    def summary(self) -> str:
+        stats = self.session_stats
+        rate = stats["hits"] / stats["parsed"] if stats["parsed"] else 0
+        return (f"Plantillas: {stats['hits']}/{stats['parsed']} aciertos ({rate:.0%}), "
+                f"{stats['fallbacks']} descartes, {stats['learned']} aprendidas, ~{stats['saved_seconds']:.2f}s ahorrados")
+
+    # --- Internos ---
+    def _record(self, key: str, amount: float = 1):
+        self.session_stats[key] += amount; self.total_stats[key] += amount; self._dirty = True
+
+    def _config_signature(self) -> str:
+        # parser_module.CONFIG cambia de identidad al recargar la config (reload_config_action). Se guarda la
+        # referencia (no id()): un id() de una config ya liberada puede reutilizarse para la nueva
+        config = parser_module.CONFIG
+        if self._config_signature_cache is None or self._config_signature_cache[0] is not config:
+            digest = hashlib.sha1(json.dumps(config, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+            self._config_signature_cache = (config, digest)
+        return self._config_signature_cache[1]
+
+    def _digest(self, text: str) -> str:
+        return hashlib.sha1((self.salt + text).encode("utf-8")).hexdigest()[:16]
+
+    def _header_signature(self, lines: list[str]) -> list[str]:
+        """Hashes de los alias de las primeras líneas de parámetros: no depende de los datos del paciente."""
+        header = []
+        for line in lines:
+            norm_alias = _first_whole_alias(parser_module._normalize(line.strip()))
+            if norm_alias: header.append(self._digest(norm_alias))
+            if len(header) == HEADER_LINES: break
+        return header
+
+    def _candidates(self, header: list[str], config_signature: str) -> list[dict]:
+        """Plantillas de la config actual con la misma cabecera, las más usadas primero."""
+        candidates = [t for t in self.templates if t["config"] == config_signature and t["header"] == header]
+        return sorted(candidates, key=lambda t: -t["hits"])[:MAX_CANDIDATES]
+
+    def _apply(self, template: dict, lines: list[str]) -> dict | None:
+        """Consulta directa de cada entrada de la plantilla. None si el informe se desvía de ella.
+
+        Repite las detecciones del parser completo en su orden (exactas y luego fuzzy) con sus mismas
+        reglas de sustitución, así un parámetro repetido conserva la aparición que elegiría el parser.
+        """
+        pm = parser_module
+        detections: list[tuple[dict, str, str, str | None, int]] = []
+        consumed: set[int] = set()
+        pos = 0
+        for entry in template["entries"]:
+            category = pm.param_to_category_map.get(entry["param"])
+            if category not in template["categories"]: return None
+            match = None
+            while pos < len(lines):
+                if pos not in consumed:
+                    match = self._match_entry(entry, category, lines, pos, consumed)
+                    if match: break
+                    if not self._is_inert(template, lines, pos): return None
+                pos += 1
+            if not match: return None
+            formatted_value, unit_type, value_line_idx = match
+            detections.append((entry, category, formatted_value, unit_type, value_line_idx))
+            consumed.update((pos, value_line_idx)); pos += 1
+        for idx in range(pos, len(lines)):
+            if idx not in consumed and not self._is_inert(template, lines, idx): return None
+
+        # { Categoria: { StdName: (FormattedValue, UnitType, DetectionMethod, LineIndex) } }, como en parse_report_layout
+        results_intermediate: dict[str, dict] = {category: {} for category in template["categories"]}
+        for method in ("exact", "fuzzy"):
+            for entry, category, formatted_value, unit_type, value_line_idx in detections:
+                if entry["method"] != method: continue
+                existing = results_intermediate[category].get(entry["param"])
+                if method == "exact" and existing and \
+                   pm.UNIT_TYPE_PRIORITY.get(unit_type, 0) < pm.UNIT_TYPE_PRIORITY.get(existing[1], 0): return None
+                if method == "fuzzy" and existing and existing[2] == "exact": return None
+                results_intermediate[category][entry["param"]] = (formatted_value, unit_type, method, value_line_idx)
+        results: dict[str, dict] = {}
+        for category, items in results_intermediate.items():
+            for param_std, (formatted_value, unit_type, method, value_line_idx) in items.items():
+                results.setdefault(category, {})[param_std] = (pm._display_value(param_std, formatted_value, unit_type, method), value_line_idx)
+        return results
+
+    def _match_entry(self, entry: dict, category: str, lines: list[str], i: int, consumed: set[int]) -> tuple[str, str | None, int] | None:
+        """Reproduce sobre la línea i la detección que el parser completo hizo para la entrada."""
+        pm = parser_module; line = lines[i]; param_std = entry["param"]
+        if entry["method"] == "fuzzy":
+            if self._digest(pm._line_skeleton(line)) != entry["skeleton_hash"]: return None
+            # La Pasada 1 no debe poder guardar la línea (su valor podría venir de una línea siguiente distinta)
+            choice = pm._choose_line_alias(line, pm._normalize(line.strip()), lines, i, consumed)
+            if choice and pm._format_exact_value(choice[0], pm.param_to_category_map[choice[0]], choice[1], choice[3], lines, i, choice[2]): return None
+            formatted = pm._format_fuzzy_value(param_std, line)
+            if not formatted or formatted[1] != entry["unit_type"]: return None
+            return formatted[0].strip(), formatted[1], i
+        normalized_line = pm._normalize(line.strip())
+        if self._digest(normalized_line[:entry["prefix_len"]]) != entry["prefix_hash"]: return None
+        # Texto añadido en la línea (p. ej. otro parámetro con alias más largo) puede cambiar el alias que elige el parser
+        choice = pm._choose_line_alias(line, normalized_line, lines, i, consumed)
+        if not choice: return None
+        chosen_param, value_match, search_line_idx, line_remainder, norm_alias, prefix = choice
+        if chosen_param != param_std or len(norm_alias) != entry["alias_len"] or len(prefix) != entry["prefix_len"] or \
+           search_line_idx - i != entry["offset"]: return None
+        formatted = pm._format_exact_value(param_std, category, value_match, line_remainder, lines, i, search_line_idx)
+        # El tipo de unidad distingue p. ej. la línea de % de la de valor absoluto de un mismo alias
+        if not formatted or formatted[1] != entry["unit_type"]: return None
+        return formatted[0].strip(), formatted[1], search_line_idx
+
+    def _is_inert(self, template: dict, lines: list[str], idx: int) -> bool:
+        """True si la línea no puede aportar un parámetro.
+
+        Sin alias: vista en la plantilla (known_lines) o sin coincidencia fuzzy. Con alias: solo si el parser
+        completo ya la descartó con la misma línea siguiente (silent_alias_lines); una línea con alias que
+        no está entre las detecciones de la plantilla (p. ej. un parámetro repetido de más) invalida.
+        """
+        pm = parser_module
+        normalized_line = pm._normalize(lines[idx].strip())
+        if not normalized_line: return True
+        if _first_whole_alias(normalized_line):
+            return self._context_digest(lines, idx) in template["silent_alias_lines"]
+        if self._digest(pm.RE_NUMBER_MASK.sub("#", normalized_line)) in template["known_lines"]: return True
+        return not _matches_fuzzy(lines[idx])
+
+    def _context_digest(self, lines: list[str], idx: int) -> str:
+        """Hash del esqueleto de la línea y de la siguiente (de la que puede tomar el valor)."""
+        next_skeleton = parser_module._line_skeleton(lines[idx + 1]) if idx + 1 < len(lines) else ""
+        return self._digest(parser_module._line_skeleton(lines[idx]) + "\n" + next_skeleton)
+
+    def _learn(self, lines: list[str], header: list[str], config_signature: str, results: dict, layout_entries: list[dict], full_seconds: float):
+        if len(layout_entries) < MIN_TEMPLATE_ENTRIES: return
+        entry_lines = {entry["line"] for entry in layout_entries} | {entry["line"] + entry["offset"] for entry in layout_entries}
+        known_lines: set[str] = set(); silent_alias_lines: set[str] = set()
+        for idx, line in enumerate(lines):
+            normalized_line = parser_module._normalize(line.strip())
+            if idx in entry_lines or not normalized_line: continue
+            # Líneas con alias nunca van a known_lines: solo se aceptan con el mismo contexto en silent_alias_lines
+            if _first_whole_alias(normalized_line): silent_alias_lines.add(self._context_digest(lines, idx))
+            elif not _matches_fuzzy(line): known_lines.add(self._digest(parser_module._line_skeleton(line)))
+        entries = [self._stored_entry(entry) for entry in layout_entries]
+        fingerprint = json.dumps([config_signature, header, [(e["param"], e.get("prefix_hash") or e.get("skeleton_hash"), e["offset"], e["unit_type"]) for e in entries]])
+        template_id = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+        now = datetime.now().isoformat(timespec="seconds")
+        existing = next((t for t in self.templates if t["id"] == template_id), None)
+        if existing:
+            # Mismo formato que no encajó: sustituir (no acumular) líneas conocidas y refrescar el tiempo de referencia
+            existing["known_lines"] = known_lines; existing["silent_alias_lines"] = silent_alias_lines
+            existing["full_parse_seconds"] = full_seconds; existing["last_used"] = now
+            self._dirty = True
+            return
+        if len(self.templates) >= MAX_TEMPLATES:
+            evicted = min(self.templates, key=lambda t: (t["hits"], t["last_used"]))
+            self.templates.remove(evicted); logger.info(f"Plantilla {evicted['id']} descartada (límite {MAX_TEMPLATES}).")
+        self.templates.append({"id": template_id, "config": config_signature, "header": header, "categories": list(results),
+                               "entries": entries, "known_lines": known_lines, "silent_alias_lines": silent_alias_lines,
+                               "full_parse_seconds": full_seconds,
+                               "hits": 0, "created": now, "last_used": now})
+        self._record("learned")
+        logger.info(f"Nueva plantilla de formato {template_id} ({len(entries)} parámetros).")
+
+    def _stored_entry(self, entry: dict) -> dict:
+        """Entrada de parse_report_layout sin texto del informe: prefijos y esqueletos como hashes."""
+        stored = {"param": entry["param"], "method": entry["method"], "offset": entry["offset"], "unit_type": entry["unit_type"]}
+        if entry["method"] == "fuzzy": stored["skeleton_hash"] = self._digest(entry["skeleton"])
+        else: stored.update(prefix_hash=self._digest(entry["prefix"]), prefix_len=len(entry["prefix"]), alias_len=len(entry["alias"]))
+        return stored
+
+def _first_whole_alias(normalized_line: str) -> str | None:
+    """Primer alias (del más largo al más corto) presente como palabra completa en la línea normalizada."""
+    pm = parser_module
+    for norm_alias in pm.sorted_normalized_aliases:
+        start_index = normalized_line.find(norm_alias)
+        if start_index != -1 and pm._is_whole_alias(normalized_line, start_index, start_index + len(norm_alias)): return norm_alias
+    return None
+
+def _matches_fuzzy(line: str) -> bool:
+    """True si la Pasada 2 (fuzzy) del parser podría usar la línea."""
+    return bool(parser_module.RE_VALUE_UNIT.search(line) and parser_module.fuzzy_match_parameter(line, threshold=FUZZY_THRESHOLD))
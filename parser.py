@@ -81,6 +81,9 @@ RE_VALUE_UNIT = re.compile(
     r"(?:(?P<percent>%)|(?P<unit>[a-zA-Zμmcgµg/]+(?:[ \t]*[a-zA-Zμmcgµg%/²³\^]+)*\b))?"
 )
 RE_SEROLOGY = re.compile(r"\b(POSITIVO|NEGATIVO|DUDOSO)\b", re.IGNORECASE)
+RE_NUMBER_MASK = re.compile(r"\d+(?:[.,]\d+)*")
+# Un resultado exacto sustituye a otro del mismo parámetro si su tipo de unidad tiene prioridad >= (gana el último)
+UNIT_TYPE_PRIORITY = {'abs': 5, 'other': 4, '%': 3, 'status': 2, None: 1}
 
 # --- Funciones de Parsing (Continuación) ---
 def fuzzy_match_parameter(text: str, threshold=0.75) -> str | None:
@@ -125,10 +128,112 @@ def validate_unit(param_std: str, found_unit: str | None, unit_type: str | None)
     if not valid: logger.warning(f"Validación fallida '{param_std}': Encontrado='{found_unit}'({unit_type}), Esperado='{expected}'")
     return valid
 
-def parse_report_text(raw_text: str) -> dict:
-    """Analiza texto, validando unidades y guardando línea para orden."""
+def _line_skeleton(line: str) -> str:
+    """Línea normalizada con los números enmascarados ('#'); identifica la línea dentro de un formato."""
+    return RE_NUMBER_MASK.sub("#", _normalize(line))
+
+def _is_whole_alias(normalized_line: str, start_index: int, end_index: int) -> bool:
+    """Alias como palabra completa: separado por espacio al inicio y por espacio, número o </> al final."""
+    return (start_index == 0 or normalized_line[start_index-1].isspace()) and \
+           (end_index == len(normalized_line) or normalized_line[end_index].isspace() or \
+            normalized_line[end_index].isdigit() or normalized_line[end_index] in '<>')
+
+def _find_value_match(category: str, line_remainder: str, lines: list[str], i: int, processed_lines: set[int]):
+    """Busca el valor de un alias en el resto de su línea o en la siguiente. Devuelve (match, índice línea)."""
+    if category == "Serologías":
+        serology_match = RE_SEROLOGY.search(line_remainder)
+        if serology_match and serology_match.start() < 15: return serology_match, i
+        elif i + 1 < len(lines) and (i+1) not in processed_lines:
+             serology_match_next = RE_SEROLOGY.search(lines[i+1])
+             if serology_match_next and len(lines[i+1].strip()) < 20: return serology_match_next, i + 1
+    else:
+        numeric_match = RE_VALUE_UNIT.search(line_remainder)
+        if numeric_match and numeric_match.start() < 10: return numeric_match, i
+        elif i + 1 < len(lines) and (i+1) not in processed_lines:
+            numeric_match_next = RE_VALUE_UNIT.match(lines[i+1].strip())
+            if numeric_match_next: return numeric_match_next, i + 1
+    return None, -1
+
+def _choose_line_alias(line: str, normalized_line: str, lines: list[str], i: int, processed_lines: set[int]) -> tuple | None:
+    """Alias que elige la Pasada 1 para la línea i: el primero (del más largo al más corto) completo, con categoría y valor.
+
+    Devuelve (StdName, value_match, search_line_idx, line_remainder, alias, prefijo normalizado hasta el alias) o None.
+    """
+    for norm_alias in sorted_normalized_aliases:
+        try:
+            start_index = normalized_line.find(norm_alias)
+            if start_index != -1:
+                end_index = start_index + len(norm_alias)
+                if _is_whole_alias(normalized_line, start_index, end_index):
+                    param_std = alias_to_std_name_map[norm_alias]
+                    category = param_to_category_map.get(param_std)
+                    if not category: continue
+                    line_remainder = line[start_index + len(norm_alias):].strip()
+                    temp_value_match, temp_search_line_idx = _find_value_match(category, line_remainder, lines, i, processed_lines)
+
+                    if temp_value_match:
+                        logger.debug(f"Candidato Exacto línea {i+1}: '{norm_alias}'->'{param_std}' valor línea {temp_search_line_idx+1}")
+                        return param_std, temp_value_match, temp_search_line_idx, line_remainder, norm_alias, normalized_line[:end_index]
+        except Exception as e: logger.error(f"Error procesando alias '{norm_alias}' línea {i+1}: {e}", exc_info=True); continue
+    return None
+
+def _format_exact_value(param_std: str, category: str, value_match, line_remainder: str, lines: list[str], i: int, search_line_idx: int) -> tuple[str, str | None] | None:
+    """Formatea y valida el valor de una detección exacta. Devuelve (FormattedValue, UnitType) o None."""
+    if category == "Serologías":
+        status = value_match.group(1).lower()
+        current_value_str = f"{param_std}: {status}"
+        if validate_unit(param_std, None, "status"):
+            logger.info(f"Parseado Serología: {current_value_str} (Línea {search_line_idx+1})")
+            return current_value_str, "status"
+        return None
+    sign, value, unit, unit_type = extract_value_and_unit(value_match.string)
+    if value is None or not validate_unit(param_std, unit, unit_type): return None
+    unit_final_formatted = unit
+    current_unit_type = unit_type
+    if param_std == "F. glomerular calculado":
+         full_unit_pattern = r"ml/min/1[.,]73m[2²\^]"
+         if re.search(full_unit_pattern, line_remainder, re.IGNORECASE) or \
+           (search_line_idx == i + 1 and re.search(full_unit_pattern, lines[search_line_idx], re.IGNORECASE)):
+             unit_final_formatted = "ml/min/1.73m²"; current_unit_type = 'other'
+         elif sign == '>' and unit_final_formatted is None:
+              unit_final_formatted = "ml/min/1.73m²"; current_unit_type = 'other'
+    current_value_str = f"{param_std}: {sign}{value}{' ' + unit_final_formatted if unit_final_formatted else ''}"
+    logger.info(f"Parseado y VALIDADO Numérico: {current_value_str} (Tipo: {current_unit_type}) (Línea {search_line_idx+1})")
+    return current_value_str, current_unit_type
+
+def _format_fuzzy_value(param_std: str, line: str) -> tuple[str, str | None] | None:
+    """Formatea y valida el valor de una detección fuzzy. Devuelve (FormattedValue, UnitType) o None."""
+    sign, value, unit, unit_type = extract_value_and_unit(line)
+    if value is None or not validate_unit(param_std, unit, unit_type): return None
+    return f"{param_std}: {sign}{value}{' ' + unit if unit else ''}", unit_type
+
+def _display_value(std_name: str, formatted_value: str, unit_type: str | None, detection_method: str) -> str:
+    display_value = formatted_value + " [~]" if detection_method == "fuzzy" else formatted_value
+    # Asegurar % final
+    expected_type_for_std = EXPECTED_UNITS_OR_TYPES.get(std_name)
+    if expected_type_for_std == '%' and unit_type == '%' and not display_value.replace(' [~]', '').endswith('%'):
+         parts = display_value.split(":", 1); val_part = parts[1].replace('[~]', '').strip().split(" ")[0]
+         display_value = f"{std_name}: {val_part} %{' [~]' if detection_method == 'fuzzy' else ''}"
+    return display_value
+
+def parse_report_text(raw_text: str, template_store=None) -> dict:
+    """Analiza texto, validando unidades y guardando línea para orden.
+
+    Con template_store (ver layout_templates.LayoutTemplateStore) se intenta antes la plantilla de formato aprendida.
+    """
+    if template_store is not None: return template_store.parse(raw_text)
+    return parse_report_layout(raw_text)[0]
+
+def parse_report_layout(raw_text: str) -> tuple[dict, list[dict]]:
+    """Parseo completo. Devuelve (resultados para formatter, detecciones guardadas en orden de línea).
+
+    Las detecciones incluyen las que luego se sustituyen (p. ej. % y luego absoluto de un mismo parámetro),
+    para que layout_templates pueda repetir las mismas sustituciones.
+    """
     # Guardar { Categoria: { StdName: (FormattedValue, UnitType, DetectionMethod, LineIndex) } }
     results_intermediate: dict = defaultdict(lambda: defaultdict(tuple))
+    # Cada resultado guardado (aunque luego se sustituya), para aprender plantillas (ver layout_templates)
+    layout_entries: list[dict] = []
     processed_lines: set[int] = set()
     lines = raw_text.splitlines()
     unrecognized_lines_with_values: list[tuple[int, str]] = []
@@ -139,90 +244,34 @@ def parse_report_text(raw_text: str) -> dict:
         normalized_line = _normalize(line.strip())
         if not normalized_line: continue
 
-        best_match_for_line = None; found_by_exact = False
-
-        for norm_alias in sorted_normalized_aliases:
-            try:
-                start_index = normalized_line.find(norm_alias)
-                if start_index != -1:
-                    end_index = start_index + len(norm_alias)
-                    is_whole = (start_index == 0 or normalized_line[start_index-1].isspace()) and \
-                               (end_index == len(normalized_line) or normalized_line[end_index].isspace() or \
-                                normalized_line[end_index].isdigit() or normalized_line[end_index] in '<>')
-                    if is_whole:
-                        param_std = alias_to_std_name_map[norm_alias]
-                        category = param_to_category_map.get(param_std)
-                        if not category: continue
-                        line_remainder = line[start_index + len(norm_alias):].strip()
-                        temp_value_match = None; temp_search_line_idx = -1
-
-                        if category == "Serologías":
-                            serology_match = RE_SEROLOGY.search(line_remainder)
-                            if serology_match and serology_match.start() < 15: temp_value_match = serology_match; temp_search_line_idx = i
-                            elif i + 1 < len(lines) and (i+1) not in processed_lines:
-                                 serology_match_next = RE_SEROLOGY.search(lines[i+1])
-                                 if serology_match_next and len(lines[i+1].strip()) < 20: temp_value_match = serology_match_next; temp_search_line_idx = i + 1
-                        else:
-                            numeric_match = RE_VALUE_UNIT.search(line_remainder)
-                            if numeric_match and numeric_match.start() < 10: temp_value_match = numeric_match; temp_search_line_idx = i
-                            elif i + 1 < len(lines) and (i+1) not in processed_lines:
-                                numeric_match_next = RE_VALUE_UNIT.match(lines[i+1].strip())
-                                if numeric_match_next: temp_value_match = numeric_match_next; temp_search_line_idx = i + 1
-
-                        if temp_value_match:
-                            best_match_for_line = (param_std, temp_value_match, temp_search_line_idx, line_remainder)
-                            logger.debug(f"Candidato Exacto línea {i+1}: '{norm_alias}'->'{param_std}' valor línea {temp_search_line_idx+1}")
-                            break
-            except Exception as e: logger.error(f"Error procesando alias '{norm_alias}' línea {i+1}: {e}", exc_info=True); continue
+        best_match_for_line = _choose_line_alias(line, normalized_line, lines, i, processed_lines); found_by_exact = False
 
         if not best_match_for_line:
             if i not in processed_lines and RE_VALUE_UNIT.search(line): unrecognized_lines_with_values.append((i, line))
             continue
 
-        param_std, value_match, search_line_idx, line_remainder_orig = best_match_for_line
+        param_std, value_match, search_line_idx, line_remainder_orig, matched_alias, matched_prefix = best_match_for_line
         if search_line_idx in processed_lines: continue
 
         category = param_to_category_map[param_std]
         existing_data = results_intermediate[category].get(param_std)
-        current_value_str = None; current_unit_type = None; unit_final_formatted = None; valid_unit_found = False
-
-        if category == "Serologías":
-            status = value_match.group(1).lower()
-            current_value_str = f"{param_std}: {status}"
-            current_unit_type = "status"
-            if validate_unit(param_std, None, current_unit_type):
-                valid_unit_found = True
-                logger.info(f"Parseado Serología: {current_value_str} (Línea {search_line_idx+1})")
-        else:
-            sign, value, unit, unit_type = extract_value_and_unit(value_match.string)
-            if value is not None:
-                if validate_unit(param_std, unit, unit_type):
-                    valid_unit_found = True
-                    unit_final_formatted = unit
-                    current_unit_type = unit_type
-                    if param_std == "F. glomerular calculado":
-                         full_unit_pattern = r"ml/min/1[.,]73m[2²\^]"
-                         if re.search(full_unit_pattern, line_remainder_orig, re.IGNORECASE) or \
-                           (search_line_idx == i + 1 and re.search(full_unit_pattern, lines[search_line_idx], re.IGNORECASE)):
-                             unit_final_formatted = "ml/min/1.73m²"; current_unit_type = 'other'
-                         elif sign == '>' and unit_final_formatted is None:
-                              unit_final_formatted = "ml/min/1.73m²"; current_unit_type = 'other'
-                    current_value_str = f"{param_std}: {sign}{value}{' ' + unit_final_formatted if unit_final_formatted else ''}"
-                    logger.info(f"Parseado y VALIDADO Numérico: {current_value_str} (Tipo: {current_unit_type}) (Línea {search_line_idx+1})")
-
-        if valid_unit_found and current_value_str:
+        formatted = _format_exact_value(param_std, category, value_match, line_remainder_orig, lines, i, search_line_idx)
+
+        if formatted:
+            current_value_str, current_unit_type = formatted
             should_replace = False; existing_unit_type = existing_data[1] if existing_data else None
             if not existing_data: should_replace = True
             else:
-                priority_map = {'abs': 5, 'other': 4, '%': 3, 'status': 2, None: 1}
-                current_priority = priority_map.get(current_unit_type, 0)
-                existing_priority = priority_map.get(existing_unit_type, 0)
+                current_priority = UNIT_TYPE_PRIORITY.get(current_unit_type, 0)
+                existing_priority = UNIT_TYPE_PRIORITY.get(existing_unit_type, 0)
                 if current_priority >= existing_priority: should_replace = True
 
             if should_replace:
                  logger.debug(f"Exact Match: Guardando '{param_std}' (Tipo: {current_unit_type}) valor línea {search_line_idx+1}")
                  # *** GUARDAR LINE INDEX ***
                  results_intermediate[category][param_std] = (current_value_str.strip(), current_unit_type, "exact", search_line_idx)
+                 layout_entries.append({"param": param_std, "method": "exact", "line": i, "offset": search_line_idx - i,
+                                       "unit_type": current_unit_type, "alias": matched_alias, "prefix": matched_prefix})
                  processed_lines.add(search_line_idx)
                  if i != search_line_idx and i not in processed_lines: processed_lines.add(i)
                  found_by_exact = True
@@ -240,19 +289,18 @@ def parse_report_text(raw_text: str) -> dict:
         if potential_param_std:
             category = param_to_category_map.get(potential_param_std)
             if not category: continue
-            sign, value, unit, unit_type = extract_value_and_unit(line)
-            if value is not None:
-                if validate_unit(potential_param_std, unit, unit_type):
-                    existing_data = results_intermediate[category].get(potential_param_std)
-                    if not existing_data or existing_data[2] != "exact": # Solo si no hay exacto
-                        unit_final = unit
-                        formatted_value = f"{potential_param_std}: {sign}{value}{' ' + unit_final if unit_final else ''}"
-                        detection_method = "fuzzy"
-                        logger.info(f"Fuzzy Match: Guardando '{potential_param_std}' (Tipo: {unit_type}) valor línea {i+1}")
-                        # *** GUARDAR LINE INDEX (i) ***
-                        results_intermediate[category][potential_param_std] = (formatted_value.strip(), unit_type, detection_method, i)
-                        processed_lines.add(i); fuzzy_found_count += 1
-                # else: logger ya advirtió
+            formatted = _format_fuzzy_value(potential_param_std, line)
+            if formatted:
+                existing_data = results_intermediate[category].get(potential_param_std)
+                if not existing_data or existing_data[2] != "exact": # Solo si no hay exacto
+                    formatted_value, unit_type = formatted
+                    logger.info(f"Fuzzy Match: Guardando '{potential_param_std}' (Tipo: {unit_type}) valor línea {i+1}")
+                    # *** GUARDAR LINE INDEX (i) ***
+                    results_intermediate[category][potential_param_std] = (formatted_value.strip(), unit_type, "fuzzy", i)
+                    layout_entries.append({"param": potential_param_std, "method": "fuzzy", "line": i, "offset": 0,
+                                           "unit_type": unit_type, "skeleton": _line_skeleton(line)})
+                    processed_lines.add(i); fuzzy_found_count += 1
+            # else: logger ya advirtió
 
     # --- Formatear salida final (preparando para formatter) ---
     # Devolver dict { Categoria: { StdName: (FormattedValue_with_Marker, LineIndex) } }
@@ -261,18 +309,13 @@ def parse_report_text(raw_text: str) -> dict:
     for category, items in results_intermediate.items():
         for std_name, (formatted_value, unit_type, detection_method, line_idx) in items.items():
              if formatted_value:
-                 display_value = formatted_value + " [~]" if detection_method == "fuzzy" else formatted_value
-                 # Asegurar % final
-                 expected_type_for_std = EXPECTED_UNITS_OR_TYPES.get(std_name)
-                 if expected_type_for_std == '%' and unit_type == '%' and not display_value.replace(' [~]', '').endswith('%'):
-                      parts = display_value.split(":", 1); val_part = parts[1].replace('[~]', '').strip().split(" ")[0]
-                      display_value = f"{std_name}: {val_part} %{' [~]' if detection_method == 'fuzzy' else ''}"
-
+                 display_value = _display_value(std_name, formatted_value, unit_type, detection_method)
                  final_results_for_formatter[category][std_name] = (display_value, line_idx) # Guardar tupla
                  unique_params_count += 1
 
     logger.info(f"Parseo finalizado. {unique_params_count} parámetros únicos para formatear.")
-    return dict(final_results_for_formatter) # Devolver dict listo para formatear
+    layout_entries.sort(key=lambda entry: entry["line"])
+    return dict(final_results_for_formatter), layout_entries # Devolver dict listo para formatear
 
 # --- Funciones de Diagnóstico ---
 # (get_unrecognized_lines y analyze_detection_success se mantienen igual que v1.2.2)
@@ -0,0 +1,149 @@
+# lab_transcriber/profiler.py (v1.4.0 - Perfilado opcional de CPU y memoria por archivo)
+from __future__ import annotations
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SUBDIR = "profiles"
+REPORT_FILENAME = "resumen_perfil.txt"
+DEFAULT_TOP_N = 20
+TRACEMALLOC_FRAMES = 10
+# Excluir del snapshot las asignaciones propias del perfilador, de tracemalloc e importlib
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+def _safe_name(text: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", text) or "archivo"
+
+def _safe_stem(path: str | Path) -> str:
+    return _safe_name(Path(path).stem)
+
+class BatchProfiler:
+    """Perfila con cProfile/tracemalloc cada archivo de un lote y genera un resumen top-N.
+
+    Desactivado (sin cpu ni memory) no crea archivos y call() invoca la función directamente.
+    """
+    def __init__(self, data_dir: str | Path, cpu: bool = False, memory: bool = False, top_n: int = DEFAULT_TOP_N):
+        if top_n < 1: raise ValueError(f"top_n debe ser >= 1 (recibido {top_n}).")
+        self.cpu = cpu; self.memory = memory; self.top_n = top_n
+        self.enabled = cpu or memory
+        self.output_dir: Path | None = None
+        if self.enabled:
+            # Microsegundos: varias ejecuciones CLI seguidas (bucle de shell) no deben compartir carpeta
+            self.output_dir = Path(data_dir) / PROFILE_SUBDIR / datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            os.makedirs(self.output_dir, exist_ok=False)
+            logger.info(f"Perfilado activo (CPU={cpu}, memoria={memory}). Salida: {self.output_dir}")
+        self._current: tuple[dict, cProfile.Profile | None, str] | None = None
+        self._files: list[dict] = []
+        # { (archivo, línea): [bytes, bloques, nº informes] } acumulado de la diferencia antes/después de cada etapa
+        self._alloc_sites: dict[tuple[str, int], list[int]] = defaultdict(lambda: [0, 0, 0])
+
+    @contextmanager
+    def profile_file(self, pdf_path: str | Path):
+        """Agrupa las llamadas a call() hechas dentro del bloque bajo un mismo archivo."""
+        if not self.enabled:
+            yield; return
+        stem = f"{len(self._files) + 1:03d}_{_safe_stem(pdf_path)}"
+        record = {"file": Path(pdf_path).name, "stages": defaultdict(float), "pstats": None, "stage_peaks_kib": {}}
+        profile = cProfile.Profile() if self.cpu else None
+        started_tracing = False
+        if self.memory and not tracemalloc.is_tracing(): tracemalloc.start(TRACEMALLOC_FRAMES); started_tracing = True
+        self._current = (record, profile, stem)
+        try:
+            yield
+        finally:
+            self._current = None
+            if started_tracing: tracemalloc.stop()
+            if profile is not None and record["stages"]: # pstats no admite perfiles vacíos
+                record["pstats"] = self.output_dir / f"{stem}.pstats"
+                profile.dump_stats(record["pstats"])
+            self._files.append(record)
+            logger.info(f"Perfil '{record['file']}': {sum(record['stages'].values()):.3f}s en etapas perfiladas.")
+
+    def call(self, func, *args, **kwargs):
+        """Ejecuta func; si hay un archivo en curso, mide su tiempo, la perfila con cProfile y mide su memoria."""
+        if self._current is None: return func(*args, **kwargs)
+        record, profile, stem = self._current
+        stage = func.__qualname__
+        if self.memory:
+            # Snapshot y pico por etapa: los temporales (p. ej. páginas de pdfplumber) se liberan antes de acabar el archivo
+            snapshot_before = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            tracemalloc.reset_peak(); memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        if profile is not None: profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profile is not None: profile.disable()
+            record["stages"][stage] += time.perf_counter() - start
+            if self.memory: self._record_stage_memory(record, stem, stage, snapshot_before, memory_before)
+
+    def _record_stage_memory(self, record: dict, stem: str, stage: str, snapshot_before, memory_before: int):
+        peak_kib = (tracemalloc.get_traced_memory()[1] - memory_before) / 1024
+        record["stage_peaks_kib"][stage] = max(record["stage_peaks_kib"].get(stage, 0.0), peak_kib)
+        snapshot_after = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        snapshot_after.dump(str(self.output_dir / f"{stem}_{_safe_name(stage)}.tracemalloc"))
+        for stat in snapshot_after.compare_to(snapshot_before, "lineno"):
+            if stat.size_diff <= 0: continue
+            frame = stat.traceback[0]
+            site = self._alloc_sites[(frame.filename, frame.lineno)]
+            site[0] += stat.size_diff; site[1] += max(stat.count_diff, 0); site[2] += 1
+
+    def write_report(self) -> Path | None:
+        """Escribe el resumen agregado del lote en output_dir. Devuelve su ruta o None si no hay nada."""
+        if not self.enabled or not self._files: return None
+        lines = [f"Resumen de perfilado - {len(self._files)} archivo(s) - {datetime.now():%Y-%m-%d %H:%M:%S}", ""]
+        lines += self._slowest_files_section()
+        if self.cpu: lines += self._hot_functions_section()
+        if self.memory: lines += self._stage_peaks_section() + self._allocation_sites_section()
+        report_path = self.output_dir / REPORT_FILENAME
+        report_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        logger.info(f"Resumen de perfilado escrito en: {report_path}")
+        return report_path
+
+    def _slowest_files_section(self) -> list[str]:
+        lines = [f"--- Archivos más lentos (top {self.top_n}) ---"]
+        ranked = sorted(self._files, key=lambda r: sum(r["stages"].values()), reverse=True)
+        for record in ranked[:self.top_n]:
+            stages = ", ".join(
+                f"{name}={secs:.3f}s" + (f"/pico {record['stage_peaks_kib'][name]:.1f} KiB" if name in record["stage_peaks_kib"] else "")
+                for name, secs in record["stages"].items())
+            lines.append(f"{sum(record['stages'].values()):8.3f}s  {record['file']} ({stages or 'sin etapas'})")
+        return lines + [""]
+
+    def _hot_functions_section(self) -> list[str]:
+        stats_files = [str(r["pstats"]) for r in self._files if r["pstats"]]
+        if not stats_files: return []
+        buffer = io.StringIO()
+        stats = pstats.Stats(*stats_files, stream=buffer)
+        stats.strip_dirs().sort_stats(pstats.SortKey.TIME).print_stats(self.top_n)
+        return [f"--- Funciones más costosas (tiempo propio, top {self.top_n}) ---", buffer.getvalue().strip(), ""]
+
+    def _stage_peaks_section(self) -> list[str]:
+        lines = [f"--- Mayores picos de memoria por etapa (top {self.top_n}) ---"]
+        peaks = sorted(((peak, name, r["file"]) for r in self._files for name, peak in r["stage_peaks_kib"].items()), reverse=True)
+        lines += [f"{peak:10.1f} KiB  {name}  {file_name}" for peak, name, file_name in peaks[:self.top_n]]
+        return lines + [""]
+
+    def _allocation_sites_section(self) -> list[str]:
+        lines = [f"--- Mayores sitios de asignación (memoria retenida por etapa, top {self.top_n}) ---"]
+        ranked = sorted(self._alloc_sites.items(), key=lambda item: item[1][0], reverse=True)
+        for (filename, lineno), (size, count, n_files) in ranked[:self.top_n]:
+            lines.append(f"{size / 1024:10.1f} KiB  {count:7d} bloques  {n_files:3d} archivo(s)  {filename}:{lineno}")
+        return lines + [""]
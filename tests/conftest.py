@@ -0,0 +1,5 @@
+# Los módulos viven en la raíz del repositorio (importaciones directas, como en launcher.py)
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
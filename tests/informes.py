@@ -0,0 +1,33 @@
+# Informes de ejemplo (texto ya extraído del PDF) compartidos por las pruebas
+from __future__ import annotations
+
+INFORME_BIOQUIMICA = """HOSPITAL GENERAL - LABORATORIO
+Paciente: Ana Ruiz López  NHC: 48213
+BIOQUIMICA
+Glucosa basal 95 mg/dL  70 - 110
+Urea 40 mg/dL
+Creatinina 0,9 mg/dL
+F. Glomerular calculado (CKD-EPI) > 90 mL/min/1.73m2
+Sodio 140 mmol/L
+Potasio 4.1 mmol/L
+TSH
+2.5 mU/L
+Ferritna serica 62 ng/mL
+Validado por Dr. García"""
+
+INFORME_HEMOGRAMA = """HEMOGRAMA
+HEMOGLOBINA 14,1 g/dL
+VCM 88.0 fl
+LEUCOCITOS 7.2 x10³/mm³
+NEUTROFILOS 60.5 %
+NEUTROFILOS 4.3 mil/mm3
+PLAQUETAS 250 x10³/mm³
+INR-TP 1.1
+Sat. O2 97 %"""
+
+
+def con_valores(informe: str, *sustituciones: tuple[str, str]) -> str:
+    """Mismo formato de informe con otros valores/paciente (sustituye texto literal)."""
+    for antiguo, nuevo in sustituciones:
+        informe = informe.replace(antiguo, nuevo)
+    return informe
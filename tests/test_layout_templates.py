@@ -0,0 +1,108 @@
+import pytest
+
+import layout_templates
+from informes import INFORME_BIOQUIMICA, INFORME_HEMOGRAMA, con_valores
+from layout_templates import LayoutTemplateStore
+from parser import parse_report_text
+
+OTRO_PACIENTE = con_valores(
+    INFORME_BIOQUIMICA,
+    ("Ana Ruiz López  NHC: 48213", "Juan Pérez  NHC: 99120"), ("Dr. García", "Dra. Molina"),
+    ("95 mg/dL", "131 mg/dL"), ("40 mg/dL", "52 mg/dL"), ("0,9", "1,4"), ("> 90", "> 60"),
+    ("140 mmol/L", "133 mmol/L"), ("2.5 mU/L", "7.9 mU/L"), ("62 ng/mL", "15 ng/mL"),
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LayoutTemplateStore(tmp_path)
+    store.parse(INFORME_BIOQUIMICA)
+    assert store.session_stats["learned"] == 1
+    return store
+
+
+def comprobar(store, informe):
+    """La plantilla (acierte o no) debe devolver exactamente lo mismo que el parser completo."""
+    resultado = store.parse(informe)
+    assert resultado == parse_report_text(informe)
+    return resultado
+
+
+def test_acierto_mismo_formato_otro_paciente(store):
+    resultado = comprobar(store, OTRO_PACIENTE)
+    assert store.session_stats["hits"] == 1
+    assert resultado["Bioquímica"]["Glucosa"] == ("Glucosa: 131 mg/dl", 3)
+    assert resultado["Bioquímica"]["TSH"] == ("TSH: 7.9 mU/L", 10)
+
+
+def test_acierto_con_detecciones_sustituidas(tmp_path):
+    store = LayoutTemplateStore(tmp_path)
+    store.parse(INFORME_HEMOGRAMA)
+    resultado = comprobar(store, con_valores(INFORME_HEMOGRAMA, ("60.5 %", "71.0 %"), ("4.3 mil", "9.8 mil")))
+    assert store.session_stats["hits"] == 1
+    assert resultado["Hemograma"]["Neutrófilos"] == ("Neutrófilos: 9.8 x10³/mm³", 5)
+
+
+def test_parametro_anadido_vuelve_al_parser_completo(store):
+    informe = OTRO_PACIENTE.replace("Sodio", "Cloruro 101 mmol/L\nSodio")
+    resultado = comprobar(store, informe)
+    assert store.session_stats["hits"] == 0 and store.session_stats["fallbacks"] == 1
+    assert "Cloruro" in resultado["Bioquímica"]
+
+
+def test_linea_eliminada_vuelve_al_parser_completo(store):
+    informe = OTRO_PACIENTE.replace("Potasio 4.1 mmol/L\n", "")
+    resultado = comprobar(store, informe)
+    assert store.session_stats["hits"] == 0
+    assert "Potasio" not in resultado["Bioquímica"]
+
+
+def test_parametro_repetido_conserva_la_ultima_aparicion(tmp_path):
+    def informe(primera, segunda):
+        return f"Creatinina 0.9 mg/dl\nSodio 140 mmol/L\nPotasio 4.1 mmol/L\nUrea {primera} mg/dl\nUrea {segunda} mg/dl"
+    store = LayoutTemplateStore(tmp_path)
+    store.parse(informe(95, 88))
+    assert comprobar(store, informe(120, 77))["Bioquímica"]["Urea"] == ("Urea: 77 mg/dl", 4)
+    # Una sola Urea aprendida: una segunda aparición no puede tratarse como línea conocida
+    store = LayoutTemplateStore(tmp_path / "una")
+    store.parse(informe(95, 88).rsplit("\n", 1)[0])
+    assert comprobar(store, informe(120, 77))["Bioquímica"]["Urea"] == ("Urea: 77 mg/dl", 4)
+    assert store.session_stats["hits"] == 0
+
+
+@pytest.mark.parametrize("antiguo, nuevo", [
+    ("Potasio 4.1 mmol/L", "Potasio 4.1 mmol/L - Magnesio 2.1 mg/dL"), # Alias más largo en la misma línea
+    ("TSH\n", "TSH  Hemoglobina 13 g/dL\n"),                           # Otro parámetro en la etiqueta de valor siguiente
+    ("Urea 52 mg/dL", "Urea 52 mg/dL  (repetir en ayunas)"),            # Comentario al final de una entrada
+    ("Creatinina 1,4 mg/dL", "Creatinina 1,4 mg/dL  *H*"),              # Marca de valor fuera de rango
+    ("TSH\n", "TSH (tirotropina)\n"),                                  # Texto extra en la etiqueta de valor siguiente
+    ("Ferritna serica 15 ng/mL", "Ferritna serica 15 ng/mL  Sodio 141 mmol/L"), # Alias en una línea fuzzy
+])
+def test_texto_anadido_en_linea_de_entrada(store, antiguo, nuevo):
+    informe = OTRO_PACIENTE.replace(antiguo, nuevo)
+    assert informe != OTRO_PACIENTE
+    comprobar(store, informe)
+
+
+def test_sin_datos_de_paciente_en_disco(store, tmp_path):
+    store.parse(OTRO_PACIENTE); store.save()
+    contenido = (tmp_path / layout_templates.TEMPLATES_FILENAME).read_text(encoding="utf-8").lower()
+    for texto in ("ana ruiz", "juan", "paciente", "garcía", "glucosa basal", "ferritna"):
+        assert texto not in contenido
+
+
+def test_persistencia_y_formato_de_otro_laboratorio(store, tmp_path):
+    store.save()
+    recargado = LayoutTemplateStore(tmp_path)
+    comprobar(recargado, OTRO_PACIENTE)
+    assert recargado.session_stats["hits"] == 1
+    # Cabecera distinta: ni siquiera se verifica la plantilla, parseo completo directo
+    comprobar(recargado, INFORME_HEMOGRAMA)
+    assert recargado.session_stats["fallbacks"] == 0 and recargado.session_stats["learned"] == 1
+
+
+def test_firma_de_config_al_recargar(store, monkeypatch):
+    import parser
+    firma = store._config_signature()
+    monkeypatch.setattr(parser, "CONFIG", {**parser.CONFIG, "recargada": True})
+    assert store._config_signature() != firma
@@ -0,0 +1,39 @@
+from informes import INFORME_BIOQUIMICA, INFORME_HEMOGRAMA
+from parser import parse_report_layout, parse_report_text
+
+# Salida de parse_report_text antes de separar parse_report_layout (v1.2.3)
+ESPERADO_BIOQUIMICA = {
+    'Bioquímica': {'Creatinina': ('Creatinina: 0.9 mg/dl', 5),
+                   'F. glomerular calculado': ('F. glomerular calculado: >90 ml/min/1.73m²', 6),
+                   'Glucosa': ('Glucosa: 95 mg/dl', 3),
+                   'Potasio': ('Potasio: 4.1 mmol/L', 8),
+                   'Sodio': ('Sodio: 140 mmol/L', 7),
+                   'TSH': ('TSH: 2.5 mU/L', 10),
+                   'Urea': ('Urea: 40 mg/dl', 4)},
+    'Perfil férrico': {'Ferritina sérica': ('Ferritina sérica: 62 ng/ml [~]', 11)},
+}
+ESPERADO_HEMOGRAMA = {
+    'Gasometría': {'Sat O2': ('Sat O2: 97 %', 8)},
+    'Hemograma': {'Neutrófilos': ('Neutrófilos: 4.3 x10³/mm³', 5), 'VCM': ('VCM: 88.0 fL', 2)},
+    'Hemostasia y Coagulación': {'INR': ('INR: 1.1', 7)},
+}
+
+
+def test_parse_report_layout_igual_que_version_anterior():
+    assert parse_report_layout(INFORME_BIOQUIMICA)[0] == ESPERADO_BIOQUIMICA
+    assert parse_report_layout(INFORME_HEMOGRAMA)[0] == ESPERADO_HEMOGRAMA
+    assert parse_report_text(INFORME_BIOQUIMICA) == ESPERADO_BIOQUIMICA
+
+
+def test_parse_report_layout_registra_detecciones_sustituidas():
+    _, entradas = parse_report_layout(INFORME_HEMOGRAMA)
+    neutrofilos = [e for e in entradas if e["param"] == "Neutrófilos"]
+    assert [(e["line"], e["unit_type"]) for e in neutrofilos] == [(4, "%"), (5, "abs")]
+
+
+def test_parse_report_layout_valor_en_linea_siguiente_y_fuzzy():
+    _, entradas = parse_report_layout(INFORME_BIOQUIMICA)
+    por_param = {e["param"]: e for e in entradas}
+    assert por_param["TSH"]["offset"] == 1
+    assert por_param["Ferritina sérica"]["method"] == "fuzzy"
+    assert [e["line"] for e in entradas] == sorted(e["line"] for e in entradas)
@@ -0,0 +1,42 @@
+import pytest
+
+import profiler as profiler_module
+from profiler import BatchProfiler
+
+
+class FakeExtractor:
+    def extract_text(self):
+        temporal = [0] * (1024 * 1024)  # ~8 MiB liberados antes de acabar la etapa
+        return "Glucosa basal 95 mg/dL" if temporal else ""
+
+
+def test_desactivado_no_crea_archivos(tmp_path):
+    profiler = BatchProfiler(tmp_path)
+    with profiler.profile_file("informe.pdf"):
+        assert profiler.call(len, "abc") == 3
+    assert profiler.write_report() is None
+    assert not any(tmp_path.iterdir())
+
+
+def test_carpetas_distintas_en_el_mismo_segundo(tmp_path):
+    primera = BatchProfiler(tmp_path, cpu=True)
+    segunda = BatchProfiler(tmp_path, cpu=True)
+    assert primera.output_dir != segunda.output_dir
+
+
+def test_pico_de_memoria_por_etapa(tmp_path):
+    profiler = BatchProfiler(tmp_path, cpu=True, memory=True)
+    with profiler.profile_file("informe.pdf"):
+        profiler.call(FakeExtractor().extract_text)
+    assert profiler.write_report().is_file()
+    peak_kib = profiler._files[0]["stage_peaks_kib"]["FakeExtractor.extract_text"]
+    assert peak_kib > 7 * 1024
+    assert all(filename != profiler_module.__file__ for filename, _ in profiler._alloc_sites)
+    assert (profiler.output_dir / "001_informe.pstats").is_file()
+    assert (profiler.output_dir / "001_informe_FakeExtractor.extract_text.tracemalloc").is_file()
+
+
+@pytest.mark.parametrize("top_n", [0, -3])
+def test_top_n_no_positivo(tmp_path, top_n):
+    with pytest.raises(ValueError):
+        BatchProfiler(tmp_path, cpu=True, top_n=top_n)